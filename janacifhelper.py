@@ -12,13 +12,24 @@ Caveat: This program is not meant to be robust but to provide results quickly (a
 """
 
 import argparse
+import collections
 import datetime
+import functools
 import math
+import mmap
 import os
+import re
 import sys
 import traceback
 import CifFile
 
+try:
+    from numba import njit
+except ImportError:  # fall back to plain Python if Numba is not installed
+    def njit(**_kwargs):
+        """Return a pass-through decorator standing in for `numba.njit`."""
+        return lambda function: function
+
 __author__ = 'Dennis Wiedemann'
 __copyright__ = 'Copyright 2019, Dr. Dennis Wiedemann'
 __credits__ = ['Dennis Wiedemann']
@@ -32,6 +43,16 @@ OUTPUT_FILE_ADDITION = '_add.cif'  # Extension of the output CIF file
 BLOCK_NAME = 'global'              # Name of the CIF data block to store information in
 PHASE_NUMBER = 1                   # Number of phase to put information out on, meaningless for single-phase refinements
 NUM_LEN = 9                        # Length of numbers (in characters) stored in *.m41
+WRITE_CHUNK = 1 << 16              # Size of the chunks (in bytes) the output CIF is written in
+MARKERS = ('# Shift', '# Background', '# Asymmetry', '# Gaussian', '# Lorentzian', '### phase')
+                                   # Section markers of *.m41 in order of appearance (once per pass/phase)
+PROFILE_PARAMS = (('G~U~', 'GU'), ('G~V~', 'GV'), ('G~W~', 'GW'), ('G~P~', 'GP'),
+                  ('L~X~', 'LX'), ('L~Y~', 'LY'), ('L~Xe~', 'LXe'), ('L~Ye~', 'LYe'))
+                                   # Labels and keys of pseudo-Voigt parameters in JANA2006 order
+OPTIONAL_PARAMS = frozenset(('GP', 'LXe', 'LYe'))
+                                   # Pseudo-Voigt parameters only to be listed when refined
+
+_KV_RE = re.compile(r'(\S+)\s+(\S+)')  # Key/value pair in an *.m41 header line
 
 
 class Suppressor(object):
@@ -40,14 +61,17 @@ class Suppressor(object):
 
     def __enter__(self):
         self.stdout = sys.stdout
-        sys.stdout = self
+        self._devnull = open(os.devnull, 'w')
+        sys.stdout = self._devnull
 
     def __exit__(self, type, value, traceback):
         sys.stdout = self.stdout
+        self._devnull.close()
         if type is not None:
             raise
 
-    def write(self, x): pass
+
+_ORDINAL_SUFFIXES = ('th', 'st', 'nd', 'rd', 'th', 'th', 'th', 'th', 'th', 'th')
 
 
 def ordinal(n):
@@ -58,51 +82,80 @@ def ordinal(n):
     :return: ordinal number
     :rtype: str
     """
+    if 10 <= n % 100 <= 19:  # "teens" always take "th"
+        return '%dth' % n
+    return '%d%s' % (n, _ORDINAL_SUFFIXES[n % 10])
 
-    return '%d%s' % (n, 'tsnrhtdd'[(math.floor(n // 10) % 10 != 1) * (n % 10 < 4) * n % 10::4])
 
+_POW10 = tuple(10.0 ** k for k in range(-20, 21))  # Powers of ten for exponents in [-20, 20]
 
-def iucr_string(values):
-    """Convert a central value (average) and its s.u. into an IUCr compliant number representation.
 
-    :param values: pair of central value (average) and s.u.
-    :type values: tuple((float, float))
-    :return: IUCr compliant representation
-    :rtype: str
+def _p10(exponent, _table=_POW10):
+    """Return a power of ten from the precomputed table.
+
+    :param exponent: integral exponent between -20 and 20
+    :type exponent: int
+    :return: ten to the given power
+    :rtype: float
     """
-    if values[1] == 0 or values[1] is None:  # No or zero s.u. given
-        return str(values[0])
+    return _table[exponent + 20]
+
 
-    sig_pos = math.floor(math.log10(abs(values[1])))  # position of first significant digit
-    sig_3 = math.trunc(abs(values[1]) * 10 ** (2 - sig_pos)) / 10 ** (2 - sig_pos)  # 1st three significant s.u. digits
-    sig_3 *= 10 ** -(sig_pos + 1)  # s.u. moved directly behind decimal separator (final range: 0.100-0.999)
+@njit(cache=True, fastmath=True)
+def _iucr_core(avg, su):
+    """Round a central value (average) and its s.u. for an IUCr compliant number representation.
+
+    :param avg: central value (average)
+    :type avg: float
+    :param su: s.u.
+    :type su: float
+    :return: rounded average, rounded s.u., position of first significant digit, number of significant digits
+    :rtype: tuple((float, float, int, int))
+    """
+    su = abs(su)
+    sig_pos = int(math.floor(math.log10(su)))  # position of first significant digit
+    shift_fac = 10.0 ** (2 - sig_pos)
+    sig_3 = math.trunc(su * shift_fac) / shift_fac  # 1st three significant s.u. digits
+    sig_3 *= 10.0 ** -(sig_pos + 1)  # s.u. moved directly behind decimal separator (final range: 0.100-0.999)
 
     if sig_3 < 0.195:  # round to two digits (final s.u. range: 0.10-0.19)
-        su = round(abs(values[1]), 1 - sig_pos)
-        avg = round(values[0], 1 - sig_pos)
         sig_len = 2
     elif sig_3 < 0.950:  # round to one digit (final s.u. range: 0.2-0.9)
-        su = round(abs(values[1]), -sig_pos)
-        avg = round(values[0], -sig_pos)
         sig_len = 1
     else:  # round to two digits and move forward (final s.u.: 0.10)
         sig_pos += 1
-        su = round(abs(values[1]), 1 - sig_pos)
-        avg = round(values[0], 1 - sig_pos)
         sig_len = 2
 
+    ndigits = sig_len - 1 - sig_pos  # common rounding position of average and s.u.
+    return round(avg, ndigits), round(su, ndigits), sig_pos, sig_len
+
+
+@functools.lru_cache(maxsize=512)
+def iucr_string(values, _core=_iucr_core, _format=format):
+    """Convert a central value (average) and its s.u. into an IUCr compliant number representation.
+
+    :param values: pair of central value (average) and s.u.
+    :type values: tuple((float, float))
+    :return: IUCr compliant representation
+    :rtype: str
+    """
+    if values[1] == 0 or values[1] is None:  # No or zero s.u. given
+        return str(values[0])
+
+    avg, su, sig_pos, sig_len = _core(values[0], values[1])
+
     if sig_pos > 0:  # only integral part for s.u. >= 1.95
         sign_shift = -1 if values[0] < 0 else 0
-        avg_str = ('{:' + str(sig_pos + sign_shift) + '.0f}').format(avg).strip()
-        su_str = ('{:' + str(sig_pos) + '.0f}').format(su)
+        avg_str = _format(avg, str(sig_pos + sign_shift) + '.0f').strip()
+        su_str = _format(su, str(sig_pos) + '.0f')
     else:  # fractional and possibly integral part for s.u. < 1.95
-        avg_str = ('{:.' + str(-sig_pos + sig_len - 1) + 'f}').format(avg)
-        su_str = '{:.0f}'.format(abs(su / 10 ** (sig_pos - sig_len + 1)))
+        avg_str = _format(avg, '.' + str(sig_len - sig_pos - 1) + 'f')
+        su_str = _format(abs(su / _p10(sig_pos - sig_len + 1)), '.0f')
 
-    return '{:s}({:s})'.format(avg_str, su_str)
+    return avg_str + '(' + su_str + ')'
 
 
-def nibble_numbers(input_line, count, length=NUM_LEN):
+def nibble_numbers(input_line, count, length=NUM_LEN, _float=float):
     """Return fixed-length numbers cut from the beginning of a string.
 
     :param input_line: line to nibble the numbers from
@@ -114,10 +167,28 @@ def nibble_numbers(input_line, count, length=NUM_LEN):
     :return: numbers
     :rtype: list(floats)
     """
-    numbers = []
-    for i in range(0, count):
-        numbers.append(float(input_line[i * length:(i + 1) * length]))
-    return numbers
+    return list(map(_float, (input_line[i * length:(i + 1) * length] for i in range(count))))
+
+
+def nibble_block(line_iter, count, length=NUM_LEN, per_line=6, _float=float):
+    """Return fixed-length numbers cut from as many following lines as needed.
+
+    :param line_iter: iterator yielding the lines carrying the numbers
+    :type line_iter: iterator(str)
+    :param count: numbers of numbers to nibble
+    :type count: int
+    :param length: length of the nibbles
+    :type length: int
+    :param per_line: maximum numbers of numbers per line
+    :type per_line: int
+    :return: numbers
+    :rtype: list(floats)
+    """
+    chunks = []
+    for start in range(0, count, per_line):
+        line = next(line_iter)
+        chunks.extend(line[i * length:(i + 1) * length] for i in range(min(per_line, count - start)))
+    return list(map(_float, chunks))
 
 
 # Parse arguments
@@ -144,112 +215,91 @@ select = {}
 is_multi_phase = False
 
 with open(name_m41, 'r') as read_file:
-
-    # Read header values (selections)
-    for line in read_file:
-        if line.startswith('skipfrto'):
-            skipped.append((line.split()[1], line.split()[2]))
-        elif line.startswith('phase'):
-            is_multi_phase = True
-            line = read_file.readline() + read_file.readline()
-            phase_select.append(dict(zip(line.split()[::2], line.split()[1::2])))
-        elif line.startswith('end'):
-            break
-        else:
-            select.update(zip(line.split()[::2], line.split()[1::2]))
-
-    # Read shift parameters
-    while not line.startswith('# Shift'):
-        line = read_file.readline()
-    shift = dict(zip(['zero', 'sycos', 'sysin'], nibble_numbers(read_file.readline(), 3)))
-
-    # Read background parameters
-    while not line.startswith('# Background'):
-        line = read_file.readline()
-    background = []
-    for i in range(0, math.trunc(int(select['bckgnum']) / 6)):
-        background.append(nibble_numbers(read_file.readline(), 6))
-    if (int(select['bckgnum']) % 6) != 0:
-        background.append(nibble_numbers(read_file.readline(), int(select['bckgnum']) % 6))
-    background = [item for sublist in background for item in sublist]
-
-    # Read asymmetry parameters
-    while not line.startswith('# Asymmetry'):
-        line = read_file.readline()
-    if select['asymm'] == '1':
-        asymm = nibble_numbers(read_file.readline(), 1)[0]
-
-    # Read profile parameters
-    phase_count = 0 if is_multi_phase else PHASE_NUMBER
-    profile = {}
-    while not phase_count == PHASE_NUMBER:
-        line = read_file.readline()
-        while not line.startswith('### phase'):
-            line = read_file.readline()
-        phase_count += 1
-    while not line.startswith('# Gaussian'):
-        line = read_file.readline()
-    for key, value in zip(['GU', 'GV', 'GW', 'GP'], nibble_numbers(read_file.readline(), 4)):
-        profile[key] = value
-    while not line.startswith('# Lorentzian'):
-        line = read_file.readline()
-    for key, value in zip(['LX', 'LXe', 'LY', 'LYe'], nibble_numbers(read_file.readline(), 4)):
-        profile[key] = value
-
-    # Read shift s.u.'s
-    while not line.startswith('# Shift'):
-        line = read_file.readline()
-    shift_su = dict(zip(['zero', 'sycos', 'sysin'], nibble_numbers(read_file.readline(), 3)))
-
-    # Read background s.u.'s
-    while not line.startswith('# Background'):
-        line = read_file.readline()
-    background_su = []
-    for i in range(0, math.trunc(int(select['bckgnum']) / 6)):
-        background_su.append(nibble_numbers(read_file.readline(), 6))
-    if (int(select['bckgnum']) % 6) != 0:
-        background_su.append(nibble_numbers(read_file.readline(), int(select['bckgnum']) % 6))
-    background_su = [item for sublist in background_su for item in sublist]
-
-    # Read asymmetry s.u.'s
-    while not line.startswith('# Asymmetry'):
-        line = read_file.readline()
-    if select['asymm'] == '1':
-        asymm_su = nibble_numbers(read_file.readline(), 1)[0]
-
-    # Read profile s.u.'s
-    phase_count = 0 if is_multi_phase else PHASE_NUMBER
-    profile_su = {}
-    while not phase_count == PHASE_NUMBER:
-        line = read_file.readline()
-        while not line.startswith('### phase'):
-            line = read_file.readline()
+    line_iter = iter(read_file.read().splitlines())  # one bulk read, no per-line I/O afterwards
+
+# Read header values (selections)
+for line in line_iter:
+    parts = line.split()
+    if not parts:
+        continue
+    head = parts[0]
+    if head == 'skipfrto':
+        skipped.append((parts[1], parts[2]))
+    elif head == 'phase':
+        is_multi_phase = True
+        phase_select.append(dict(_KV_RE.findall(next(line_iter) + ' ' + next(line_iter))))
+    elif head == 'end':
+        break
+    else:  # generic key/value line
+        select.update(zip(parts[::2], parts[1::2]))
+
+# Read refined parameters (first pass) and their s.u.'s (second pass) in one sweep
+bckgnum = int(select['bckgnum'])
+shift, shift_su = {}, {}
+background, background_su = [], []
+profile, profile_su = {}, {}
+seen = collections.Counter()  # markers met so far: first occurrence holds values, second one s.u.'s
+phase_count = 0 if is_multi_phase else PHASE_NUMBER
+for line in line_iter:
+    if not line.startswith(MARKERS):
+        continue
+    if line.startswith('# Shift'):
+        if seen['Shift']:  # a second shift marker opens the s.u. pass
+            phase_count = 0 if is_multi_phase else PHASE_NUMBER
+        target = shift_su if seen['Shift'] else shift
+        seen['Shift'] += 1
+        target.update(zip(['zero', 'sycos', 'sysin'], nibble_block(line_iter, 3)))
+    elif line.startswith('# Background'):
+        target = background_su if seen['Background'] else background
+        seen['Background'] += 1
+        target.extend(nibble_block(line_iter, bckgnum))
+    elif line.startswith('# Asymmetry'):
+        if select['asymm'] == '1':
+            value = nibble_block(line_iter, 1)[0]
+            if seen['Asymmetry']:
+                asymm_su = value
+            else:
+                asymm = value
+            seen['Asymmetry'] += 1
+    elif line.startswith('### phase'):
         phase_count += 1
-    while not line.startswith('# Gaussian'):
-        line = read_file.readline()
-    for key, value in zip(['GU', 'GV', 'GW', 'GP'], nibble_numbers(read_file.readline(), 4)):
-        profile_su[key] = value
-    while not line.startswith('# Lorentzian'):
-        line = read_file.readline()
-    for key, value in zip(['LX', 'LXe', 'LY', 'LYe'], nibble_numbers(read_file.readline(), 4)):
-        profile_su[key] = value
+    elif line.startswith('# Gaussian'):
+        if phase_count == PHASE_NUMBER:
+            target = profile_su if seen['Gaussian'] else profile
+            seen['Gaussian'] += 1
+            target.update(zip(['GU', 'GV', 'GW', 'GP'], nibble_numbers(next(line_iter), 4)))
+    else:  # '# Lorentzian'
+        if phase_count == PHASE_NUMBER:
+            target = profile_su if seen['Lorentzian'] else profile
+            seen['Lorentzian'] += 1
+            target.update(zip(['LX', 'LXe', 'LY', 'LYe'], nibble_numbers(next(line_iter), 4)))
 
 print(' Done.')
 
 # Scan for and read the values from *.ref
 print('Reading from *.ref ...', end='')
 phase_count = 0
-with open(name_ref, 'r') as read_file:
-    for line in read_file:
-        if line.startswith('Cycle  RFobs'):
-            phase_count += 1
-            if phase_count == PHASE_NUMBER:
-                while line != '\n':
-                    line_old = line
-                    line = read_file.readline()
-                n_obs = int(line_old.split()[5])
-                n_all = int(line_old.split()[6])
-                rb_obs = float(line_old.split()[9])
+with open(name_ref, 'rb') as read_file, mmap.mmap(read_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    pos = 0
+    while True:
+        hit = data.find(b'Cycle  RFobs', pos)
+        if hit < 0:
+            break
+        pos = hit + 1
+        if hit > 0 and data[hit - 1:hit] != b'\n':  # marker not at the start of a line
+            continue
+        phase_count += 1
+        if phase_count == PHASE_NUMBER:
+            end = data.find(b'\n\n', hit)  # first blank line ends the cycle table
+            if end < 0:
+                end = data.find(b'\n\r\n', hit)  # the same for CRLF-terminated files
+            if end < 0:
+                end = data.size()
+            fields = data[data.rfind(b'\n', hit, end) + 1:end].split()  # last line of the table
+            n_obs = int(fields[5])
+            n_all = int(fields[6])
+            rb_obs = float(fields[9])
+            break
 print(' Done.')
 
 # Construct CIF
@@ -257,91 +307,85 @@ print('Assembling CIF items ...', end='')
 cif = CifFile.CifFile()
 cif[BLOCK_NAME] = CifFile.CifBlock()
 cif_block = cif[BLOCK_NAME]
+set_item = cif_block.__setitem__  # bound once, reused for every item store below
 
 # Set variables
 cif.header_comment = ''
 cif.set_grammar('1.1')
 
 # Store introductory items
-cif_block['_audit_conform_dict_name'] = ['cif_core.dic', 'cif_pd.dic']
-cif_block['_audit_conform_dict_version'] = ['2.4.5', '1.0.1']
-cif_block['_audit_conform_dict_location'] = ['ftp://ftp.iucr.org/pub/cif_core.dic', 'ftp://ftp.iucr.org/pub/cif_pd.dic']
+for key, value in (('_audit_conform_dict_name', ['cif_core.dic', 'cif_pd.dic']),
+                   ('_audit_conform_dict_version', ['2.4.5', '1.0.1']),
+                   ('_audit_conform_dict_location',
+                    ['ftp://ftp.iucr.org/pub/cif_core.dic', 'ftp://ftp.iucr.org/pub/cif_pd.dic'])):
+    set_item(key, value)
 cif_block.CreateLoop(['_audit_conform_dict_name', '_audit_conform_dict_version', '_audit_conform_dict_location'])
-cif_block['_audit_creation_method'] = 'JANA CIF Helper v.' + __version__
-cif_block['_audit_creation_date'] = datetime.datetime.now().strftime('%Y-%m-%d')
+set_item('_audit_creation_method', 'JANA CIF Helper v.' + __version__)
+set_item('_audit_creation_date', datetime.datetime.now().strftime('%Y-%m-%d'))
 
 # Store extracted items
 if select['absor'] == '1':
-    cif_block['_exptl_absorpt_correction_type'] = 'cylinder'
-    cif_block['_exptl_absorpt_process_details'] = '\ncorrection for a cylindrical sample with \\mR = ' + select['mir'] \
-                                                  + ' as implemented in JANA2006 (Pet\\<r\\\'i\\<cek et al., 2014)'
-
-cif_block['_reflns_number_gt'] = '{:d}'.format(n_obs)
-cif_block['_reflns_number_total'] = '{:d}'.format(n_all)
-cif_block['_refine_ls_R_I_factor'] = '{:2.4f}'.format(rb_obs / 100)
-
-skipped_string = []
-for region in skipped:
-    skipped_string.append('from {:3.2f} to {:3.2f}\\%: '.format(float(region[0]), float(region[1])))
-    cif_block['_pd_proc_info_excluded_regions'] = skipped_string
+    set_item('_exptl_absorpt_correction_type', 'cylinder')
+    set_item('_exptl_absorpt_process_details', '\ncorrection for a cylindrical sample with \\mR = ' + select['mir']
+             + ' as implemented in JANA2006 (Pet\\<r\\\'i\\<cek et al., 2014)')
+
+set_item('_reflns_number_gt', '{:d}'.format(n_obs))
+set_item('_reflns_number_total', '{:d}'.format(n_all))
+set_item('_refine_ls_R_I_factor', '{:2.4f}'.format(rb_obs / 100))
+
+skipped_string = ['from {:3.2f} to {:3.2f}\\%: '.format(float(region[0]), float(region[1]))
+                  for region in skipped]
+if skipped_string:
+    set_item('_pd_proc_info_excluded_regions', skipped_string)
     cif_block.CreateLoop(['_pd_proc_info_excluded_regions'])
 
-pd_proc_ls_special_details = '\n'
-if shift['zero'] != '0.000000':
-    pd_proc_ls_special_details = 'zero-point correction: ' + iucr_string((shift['zero'] / 100, shift_su['zero'] / 100))\
-                                 + '\\%'
-cif_block['_pd_proc_ls_special_details'] = pd_proc_ls_special_details
+if shift['zero'] != 0.0:  # an unset item is valid CIF for an uncorrected zero point
+    set_item('_pd_proc_ls_special_details',
+             'zero-point correction: ' + iucr_string((shift['zero'] / 100, shift_su['zero'] / 100)) + '\\%')
 
-_pd_proc_ls_profile_function = '\n'
 proffun = phase_select[PHASE_NUMBER - 1]['proffun'] if is_multi_phase else select['proffun']
+profile_parts = []
 if proffun == '3':
-    _pd_proc_ls_profile_function += 'pseudo-Voigt profile according to Thompson, Cox & Hastings (1987): G~U~ = '
-    _pd_proc_ls_profile_function += '0' if profile['GU'] == 0.0 else iucr_string((profile['GU'], profile_su['GU']))
-    _pd_proc_ls_profile_function += ', G~V~ = '
-    _pd_proc_ls_profile_function += '0' if profile['GV'] == 0.0 else iucr_string((profile['GV'], profile_su['GV']))
-    _pd_proc_ls_profile_function += ', G~W~ = '
-    _pd_proc_ls_profile_function += '0' if profile['GW'] == 0.0 else iucr_string((profile['GW'], profile_su['GW']))
-    if profile['GP'] != 0.0:
-        _pd_proc_ls_profile_function += ', G~P~ = ' + iucr_string((profile['GP'], profile_su['GP']))
-    _pd_proc_ls_profile_function += ', L~X~ = '
-    _pd_proc_ls_profile_function += '0' if profile['LX'] == 0.0 else iucr_string((profile['LX'], profile_su['LX']))
-    _pd_proc_ls_profile_function += ', L~Y~ = '
-    _pd_proc_ls_profile_function += '0' if profile['LY'] == 0.0 else iucr_string((profile['LY'], profile_su['LY']))
-    if profile['LXe'] != 0.0:
-        _pd_proc_ls_profile_function += ', L~Xe~ = ' + iucr_string((profile['LXe'], profile_su['LXe']))
-    if profile['LYe'] != 0.0:
-        _pd_proc_ls_profile_function += ', L~Ye~ = ' + iucr_string((profile['LYe'], profile_su['LYe']))
-
+    parts = []
+    for label, key in PROFILE_PARAMS:
+        value = profile[key]
+        if value == 0.0:
+            if key not in OPTIONAL_PARAMS:
+                parts.append(label + ' = 0')
+        else:
+            parts.append(label + ' = ' + iucr_string((value, profile_su[key])))
+    profile_parts.append('pseudo-Voigt profile according to Thompson, Cox & Hastings (1987): ' + ', '.join(parts))
 if select['asymm'] == '1':
-    _pd_proc_ls_profile_function += ';\nasymmetry correction according to Howard (1982): P = ' \
-                                   + iucr_string((asymm, asymm_su))
-cif_block['_pd_proc_ls_profile_function'] = _pd_proc_ls_profile_function
+    profile_parts.append(';\nasymmetry correction according to Howard (1982): P = ' + iucr_string((asymm, asymm_su)))
+set_item('_pd_proc_ls_profile_function', '\n' + ''.join(profile_parts))
 
-_pd_proc_ls_background_function = '\n'
+background_parts = []
 if select['manbckg'] == '1':
-    _pd_proc_ls_background_function += 'manual background (visual estimation, unrefined)'
-if select['manbckg'] == '1' and select['bckgtype'] == '1':
-    _pd_proc_ls_background_function += ' interpolated by '
+    background_parts.append('manual background (visual estimation, unrefined)')
+    if select['bckgtype'] == '1':
+        background_parts.append(' interpolated by ')
 if select['bckgtype'] == '1':
-    _pd_proc_ls_background_function += select['bckgnum'] + ' Legendre polynomials [1st: ' \
-                                       + iucr_string((background[0], background_su[0]))
-for i in range(2, int(select['bckgnum']) + 1):
-    _pd_proc_ls_background_function += ', {:s}: '.format(ordinal(i)) \
-                                       + iucr_string((background[i - 1], background_su[i - 1]))
-_pd_proc_ls_background_function += ']'
-cif_block['_pd_proc_ls_background_function'] = _pd_proc_ls_background_function
+    background_parts.append(select['bckgnum'] + ' Legendre polynomials [1st: '
+                            + iucr_string((background[0], background_su[0])))
+background_parts.extend(', {:s}: '.format(ordinal(i)) + iucr_string((background[i - 1], background_su[i - 1]))
+                        for i in range(2, bckgnum + 1))
+background_parts.append(']')
+set_item('_pd_proc_ls_background_function', '\n' + ''.join(background_parts))
 print(' Done.')
 
 # Store static items
-cif_block['_reflns_threshold_expression'] = 'I>3\\s(I)'
-cif_block['_refine_ls_structure_factor_coef'] = 'Inet'
-cif_block['_refine_ls_matrix_type'] = 'fullcycle'
-cif_block['_refine_ls_weighting_details'] = 'w=1/[\\s^2^(I)+(0.01*I)^2^]'
+for key, value in (('_reflns_threshold_expression', 'I>3\\s(I)'),
+                   ('_refine_ls_structure_factor_coef', 'Inet'),
+                   ('_refine_ls_matrix_type', 'fullcycle'),
+                   ('_refine_ls_weighting_details', 'w=1/[\\s^2^(I)+(0.01*I)^2^]')):
+    set_item(key, value)
 
 # Output CIF
 print('Writing to %s ...' % name_cif, end='')
-with open(name_cif, 'w') as write_file, Suppressor():
-    write_file.write(cif.WriteOut())
+with open(name_cif, 'wb', buffering=WRITE_CHUNK) as write_file, Suppressor():
+    view = memoryview(cif.WriteOut().encode('utf-8'))
+    for start in range(0, len(view), WRITE_CHUNK):
+        write_file.write(view[start:start + WRITE_CHUNK])
 print(' Done.')
 
 # Sendoff